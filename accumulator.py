@@ -7,9 +7,13 @@
 # values. This is what makes it tenable to use a Bloom filter, since we need
 # to guarantee no false positives for our scenario.
 
-from rsa import verify, sign
-from blind import blind, unblind, blind_sign
-from bloom import new_bloom, bloom_insert, bloom_contains
+import json
+
+from bulk_sign import sign_many, SignatureCache
+from blind import blind, unblind
+from keyring import default_keyring
+from bloom import new_bloom, bloom_insert, bloom_contains, bloom_to_hex, bloom_from_hex
+from bloom import bloom_indices, counting_bloom_insert, counting_bloom_remove
 
 # This is just for example purpose and isn't used in the algorithm.
 # Please don't use random for cryptographic purposes.
@@ -28,8 +32,7 @@ from random import randint, sample
 # Server: access to raw data, can sign()
 # Client: can verify(), blind(), and unblind()
 
-# Step 1: Server side, build the accumulator
-# 100 names generated using http://random-name-generator.info
+# The example data: 100 names generated using http://random-name-generator.info
 
 # Perfect knowledge here means that these are all of the possible elements that
 # could ever be a member. In other words: if someone not on this list gets
@@ -60,43 +63,338 @@ all_people = ["Noah Porter", "Lynn Drake", "Freda Rice", "Lana Carr",
 "Billie Bass", "Steven Patrick", "Clifford Steele", "Myron Burton",
 "Blanca Gill"]
 
-# Split them into members and non members
-num_members = randint(35, 65)
-members = set(sample(all_people, k=num_members))
-non_members = set(all_people) - members
+# All of the steps live in the Accumulator class below. Nothing expensive
+# happens until it's asked for: making an Accumulator (or importing this
+# file) doesn't sign anything or pick any blinding factors. The signature
+# cache and the blinding pool get set up the first time something needs them.
+# Each accumulator belongs to one key from a keyring (see keyring.py): it's
+# whichever key was active when it was built, and its ID gets saved with it.
+# Rotating the keyring's active key doesn't touch existing accumulators. They
+# keep answering queries with their own key until a replacement built with
+# the new key is ready to take over.
 
-# Number of buckets isn't too important
-accumulator = new_bloom(10000)
+class Accumulator:
+    def __init__(self, num_buckets=10000, path=None, signer=None, cache_dir=None,
+                 counting=False, max_deltas=64, query_cache=None, keyring=None, key_id=None):
+        self.num_buckets = num_buckets
+        self.path = path
+        self.signer = signer
+        self.keyring = keyring
+        self.key_id = key_id
+        self.cache_dir = cache_dir
+        self.counting = counting
+        self.max_deltas = max_deltas
+        self.query_cache = query_cache
+        self.version = 0
+        self.deltas = []
+        self.members = set()
+        self.non_members = {}
+        self._bloom = None
+        self._cache = None
 
-for member in members:
-    bloom_insert(sign(member), accumulator)
+    def load_filter(self):
+        if self._bloom is None:
+            if self.path is None:
+                raise ValueError("accumulator has not been built or loaded")
+            with open(self.path) as f:
+                self.restore(json.load(f))
+        return self._bloom
 
-# Ensure that we won't get false positives
-for non_member in non_members:
-    assert not bloom_contains(sign(non_member), accumulator)
+    @property
+    def bloom(self):
+        return self.load_filter()
 
-# 2. Server distributes accumulator
-pass
+    @property
+    def signature_cache(self):
+        if self._cache is None:
+            if self.cache_dir is None:
+                self._cache = SignatureCache()
+            else:
+                self._cache = SignatureCache(self.cache_dir)
+        return self._cache
 
-# 3. Client wants to check membership of an element
+# A loaded accumulator finds out its key ID from the file. One that hasn't
+# been built yet uses the keyring's active key.
 
-# Let's choose 4 people at random
-elements = sample(all_people, k=4)
+    @property
+    def key(self):
+        if self.key_id is None and self._bloom is None and self.path is not None:
+            self.load_filter()
+        return self.find_key()
 
-# 4. Client prepares element for blind signing
-blinded_elements = [blind(x) for x in elements]
+    def find_key(self):
+        keyring = self.keyring or default_keyring()
+        if self.key_id is None:
+            return keyring.active
+        return keyring.get(self.key_id)
 
-# 5. Server blind-signs the element
-blind_signatures = [blind_sign(x) for x in blinded_elements]
+    @property
+    def blinding_pool(self):
+        return self.key.blinding_pool
 
-# 6. Client recovers signatures and checks to see if they are in the filter
-signatures = [unblind(x) for x in blind_signatures]
+# Step 1: Server side, build the accumulator
+# Signing is the slow part, so everyone gets signed in one go (see
+# bulk_sign.py). The names don't change between runs, so after the first run
+# the signatures all come straight out of the cache.
+# Passing in the non-members lets us check that none of them would be a false
+# positive. (That's the "perfect knowledge" from above.) We also hang on to
+# which buckets each non-member hashes to, so later updates can redo that
+# check without signing or hashing anybody again.
+# With counting=True the filter keeps counts instead of bits, so members can
+# be removed again later.
+
+    def build(self, members, non_members=()):
+        members = list(dict.fromkeys(members))
+        non_members = list(dict.fromkeys(non_members))
+        key = self.find_key()
+        self.key_id = key.key_id
+        signatures = sign_many(members + non_members, self.signature_cache, key=key)
+        insert = counting_bloom_insert if self.counting else bloom_insert
+
+        bloom = new_bloom(self.num_buckets)
+        for sig in signatures[:len(members)]:
+            insert(sig, bloom)
+
+        indices = {}
+        for name, sig in zip(non_members, signatures[len(members):]):
+            if bloom_contains(sig, bloom):
+                raise ValueError(f"{name} would be a false positive, try more buckets")
+            indices[name] = bloom_indices(sig, bloom)
+
+        self._bloom = bloom
+        self.non_members = indices
+        self.members = set(members)
+        self.version = 0
+        self.deltas = []
+        self.filter_replaced()
+        return self
+
+# Rebuilding everything to add one person is a lot of wasted work. Adding
+# only needs the new members signed, and the only non-members that could
+# turn into false positives are ones that use a bucket that just went from
+# empty to full.
+# Every change bumps the version and records a delta: the buckets that
+# flipped between empty and full. Clients can apply those to their copy
+# instead of downloading the whole filter again.
+# Changes are made on a copy of the filter, so if one would cause a false
+# positive we raise and nothing changes.
+
+    def add(self, members):
+        self.load_filter()
+        new = [m for m in dict.fromkeys(members) if m not in self.members]
+        if not new:
+            return None
+        signatures = sign_many(new, self.signature_cache, key=self.key)
+        insert = counting_bloom_insert if self.counting else bloom_insert
+
+        bloom = list(self.bloom)
+        for sig in signatures:
+            insert(sig, bloom)
+        flipped = self.flipped_buckets(bloom)
+
+        for name, indices in self.non_members.items():
+            if name in new or flipped.isdisjoint(indices):
+                continue
+            if all(bloom[i] for i in indices):
+                raise ValueError(f"adding would make {name} a false positive")
+
+        for name in new:
+            self.non_members.pop(name, None)
+        self.members.update(new)
+        return self.commit(bloom, flipped)
+
+# Removing is the same idea in reverse, and only works with a counting
+# filter. The people we remove become non-members, so they get the false
+# positive check too: their buckets might all still be full thanks to
+# somebody else.
+
+    def remove(self, members):
+        self.load_filter()
+        if not self.counting:
+            raise ValueError("removing members needs a counting filter")
+        gone = [m for m in dict.fromkeys(members) if m in self.members]
+        if not gone:
+            return None
+        signatures = sign_many(gone, self.signature_cache, key=self.key)
+
+        bloom = list(self.bloom)
+        for sig in signatures:
+            counting_bloom_remove(sig, bloom)
+        flipped = self.flipped_buckets(bloom)
+
+        removed = {}
+        for name, sig in zip(gone, signatures):
+            indices = bloom_indices(sig, bloom)
+            if all(bloom[i] for i in indices):
+                raise ValueError(f"removing {name} would leave a false positive")
+            removed[name] = indices
+
+        self.members.difference_update(gone)
+        self.non_members.update(removed)
+        return self.commit(bloom, flipped)
+
+    def flipped_buckets(self, bloom):
+        return {i for i, (old, new) in enumerate(zip(self.bloom, bloom))
+                if bool(old) != bool(new)}
+
+# We only keep the last few deltas around. A client that's further behind
+# than that just has to load the whole filter again.
+
+    def commit(self, bloom, flipped):
+        delta = {"from_version": self.version, "to_version": self.version + 1,
+                 "flipped": sorted(flipped)}
+        self._bloom = bloom
+        self.version += 1
+        self.deltas.append(delta)
+        del self.deltas[:-self.max_deltas]
+        return delta
 
-in_accumulator = [bloom_contains(x, accumulator) for x in signatures]
+# A bucket that flipped twice since the client's version is back where it
+# started, so we only send the ones that flipped an odd number of times.
+# A version newer than ours isn't one we ever had, so there's nothing we can
+# send for it either.
+
+    def delta_since(self, version):
+        self.load_filter()
+        if version > self.version:
+            return None
+        if version == self.version:
+            return {"from_version": version, "to_version": version, "flipped": []}
+        if not self.deltas or version < self.deltas[0]["from_version"]:
+            return None
+        flipped = set()
+        for delta in self.deltas:
+            if delta["from_version"] >= version:
+                flipped ^= set(delta["flipped"])
+        return {"from_version": version, "to_version": self.version,
+                "flipped": sorted(flipped)}
+
+# Client side: flip the same buckets in our copy
+
+    def apply_delta(self, delta):
+        self.load_filter()
+        if delta["from_version"] != self.version:
+            raise ValueError(f"delta is from version {delta['from_version']}, "
+                             f"we have version {self.version}")
+        bloom = self.bloom
+        for i in delta["flipped"]:
+            bloom[i] = 0 if bloom[i] else 1
+        self.version = delta["to_version"]
+
+# Step 2: Server distributes accumulator. Here that just means writing it to
+# a file that clients can load(). Clients only ever get the bits, but the
+# server can save its own copy with everything it needs to keep updating:
+# the counts, the recent deltas and who is and isn't a member.
+
+    def dump(self, private=False):
+        self.load_filter()
+        data = {"num_buckets": self.num_buckets, "version": self.version,
+                "key_id": self.key.key_id, "bits": bloom_to_hex(self.bloom)}
+        if private:
+            data["counts"] = self.bloom if self.counting else None
+            data["deltas"] = self.deltas
+            data["members"] = sorted(self.members)
+            data["non_members"] = self.non_members
+        return data
+
+    def restore(self, data):
+        self.num_buckets = data["num_buckets"]
+        self.version = data.get("version", 0)
+        self.key_id = data.get("key_id")
+# Whether the filter counts comes from the file, never from the caller.
+# Treating a plain bit filter as counts would let remove() knock out buckets
+# that other members still need.
+        self.counting = data.get("counts") is not None
+        if self.counting:
+            self._bloom = data["counts"]
+        else:
+            self._bloom = bloom_from_hex(data["bits"], self.num_buckets)
+        self.deltas = data.get("deltas", [])
+        self.members = set(data.get("members", []))
+        self.non_members = data.get("non_members", {})
+        self.filter_replaced()
+
+# A brand new filter can reuse an old version number (build() starts over at
+# 0), so any cached answers have to go even if the version looks the same.
+# Updates through commit() or apply_delta() always change the version, which
+# the cache notices by itself.
+
+    def filter_replaced(self):
+        if self.query_cache is not None:
+            self.query_cache.invalidate(self.version)
+
+    def save(self, path=None, private=False):
+        path = path or self.path
+        with open(path, "w") as f:
+            json.dump(self.dump(private), f)
+        self.path = path
+
+# Loading reads the file straight away, so the version, key ID and members
+# are all right from the start. (It's one small JSON file; the expensive
+# parts, signing and blinding, still wait until they're needed.)
+
+    @classmethod
+    def load(cls, path, signer=None, keyring=None, cache_dir=None, query_cache=None):
+        accumulator = cls(path=path, signer=signer, keyring=keyring, cache_dir=cache_dir,
+                          query_cache=query_cache)
+        accumulator.load_filter()
+        return accumulator
+
+# Step 3: Client wants to check membership of some elements
+
+# With a QueryCache (see query_cache.py), anything we've already asked about
+# since the filter last changed gets answered without talking to the server.
+
+    def query(self, elements):
+        bloom = self.bloom
+        cache = self.query_cache
+        if cache is None:
+            return [bloom_contains(x, bloom) for x in self.fetch_signatures(elements)]
+
+        answers = {}
+        missing = []
+        for x in dict.fromkeys(elements):
+            cached = cache.get(self.version, x)
+            if cached is None:
+                missing.append(x)
+            else:
+                answers[x] = cached[1]
+
+        for x, signature in zip(missing, self.fetch_signatures(missing)):
+            answers[x] = bloom_contains(signature, bloom)
+            cache.put(self.version, x, signature, answers[x])
+
+        return [answers[x] for x in elements]
+
+    def fetch_signatures(self, elements):
+        pool = self.blinding_pool
+
+# Step 4: Client prepares element for blind signing
+# Each element gets its own blinding factor, and the client keeps the inverse
+# around to unblind with later
+        blinded_elements = [blind(x, pool) for x in elements]
+
+# Step 5: Server blind-signs the element
+        signer = self.signer or self.key.blind_sign
+        blind_signatures = [signer(x) for x, _ in blinded_elements]
+
+# Step 6: Client recovers signatures and checks to see if they are in the filter
+        return [unblind(x, r_i, pool.n) for x, (_, r_i) in zip(blind_signatures, blinded_elements)]
 
 # Let's verify that things worked!
 if __name__ == "__main__":
 
+# Split them into members and non members
+    num_members = randint(35, 65)
+    members = set(sample(all_people, k=num_members))
+    non_members = set(all_people) - members
+
+    accumulator = Accumulator().build(members, non_members)
+
+# Let's choose 4 people at random
+    elements = sample(all_people, k=4)
+    in_accumulator = accumulator.query(elements)
+
 # First let's see whether our elements are really members or not
     element_status = [(name in members) for name in elements]
 
@@ -105,9 +403,9 @@ if __name__ == "__main__":
     in_accumulator = [str(x) for x in in_accumulator]
 
 # Now we can print a table to compare
-print(f"{'Name':<30}\t{'is_member':<10}\t{'in_accumulator'}")
-for name, real_status, accum_status in zip(elements, element_status, in_accumulator):
-    print(f"{name:<30}\t{real_status:<10}\t{accum_status}")
+    print(f"{'Name':<30}\t{'is_member':<10}\t{'in_accumulator'}")
+    for name, real_status, accum_status in zip(elements, element_status, in_accumulator):
+        print(f"{name:<30}\t{real_status:<10}\t{accum_status}")
 # Name                            is_member       in_accumulator
 # Myron Burton                    False           False
 # Lana Carr                       True            True
@@ -0,0 +1,234 @@
+# Benchmarks for everything in the repo, to keep an eye on how expensive
+# things are and to check that speedups actually speed things up.
+#
+# Each benchmark runs its operation over and over until at least MIN_TIME
+# seconds have passed, and reports how many operations per second that came
+# out to (except startup, where milliseconds per import is the number anyone
+# actually cares about). Most of them run at a few different input sizes, since how things
+# scale is usually more interesting than any single number.
+#
+# Run "python3 bench.py" for everything, or name some sections to only run
+# those, e.g. "python3 bench.py md5 bloom". Results get printed as a table
+# and also appended to bench_output.txt as one line of JSON per run, so runs
+# from different days (or different commits) can be compared later.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from random import sample
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCH_OUTPUT = os.path.join(HERE, "bench_output.txt")
+
+MIN_TIME = 0.2
+
+def measure(fn, min_time=MIN_TIME):
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / runs
+
+def result(name, size, seconds, units=1, unit="ops", per_call=False):
+    return {"benchmark": name, "size": size, "seconds_per_call": seconds,
+            "per_second": units / seconds, "unit": unit, "per_call": per_call}
+
+def format_result(r):
+    if r["per_call"]:
+        return f"{r['seconds_per_call'] * 1000:>12.1f} ms/{r['unit']}"
+    return f"{r['per_second']:>12.1f} {r['unit']}/s"
+
+# Startup: how long it takes to just import each file, on top of starting up
+# Python at all. Importing should be nearly free since nothing signs, blinds
+# or builds anything until it's asked to. Each import gets its own fresh
+# interpreter (otherwise the second import is free), and we keep the best of
+# a few runs to cut down on noise.
+
+STARTUP_MODULES = ["md5", "hmac", "rsa", "bloom", "merkle", "blind", "bulk_sign",
+                   "accumulator", "rsa_accumulator"]
+
+def time_python(code, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=HERE, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_startup():
+    baseline = time_python("pass")
+    return [result("import", module, time_python(f"import {module}") - baseline,
+                   unit="import", per_call=True)
+            for module in STARTUP_MODULES]
+
+# MD5 works on 64 byte blocks (plus one more for padding), so we report
+# blocks per second
+
+def bench_md5():
+    from md5 import md5
+    results = []
+    for size in (55, 1024, 16384):
+        data = os.urandom(size)
+        blocks = (size + 8) // 64 + 1
+        results.append(result("md5", size, measure(lambda: md5(data)), blocks, "blocks"))
+    return results
+
+def bench_hmac():
+    from hmac import hmac_md5
+    results = []
+    for size in (16, 1024, 16384):
+        text = "x" * size
+        results.append(result("hmac_md5", size, measure(lambda: hmac_md5(text, "hunter2")),
+                              unit="msgs"))
+    return results
+
+# The size here is the number of values, so per_second is values per second
+
+def bench_bloom():
+    from bloom import new_bloom, bloom_insert, bloom_contains
+    results = []
+    for count in (10, 100):
+        values = [f"value {i}" for i in range(count)]
+        missing = [f"missing {i}" for i in range(count)]
+
+        def insert():
+            bloom = new_bloom(10000)
+            for value in values:
+                bloom_insert(value, bloom)
+            return bloom
+
+        bloom = insert()
+        results.append(result("bloom_insert", count, measure(insert), count, "values"))
+        results.append(result("bloom_lookup_hit", count,
+                              measure(lambda: [bloom_contains(v, bloom) for v in values]),
+                              count, "values"))
+        results.append(result("bloom_lookup_miss", count,
+                              measure(lambda: [bloom_contains(v, bloom) for v in missing]),
+                              count, "values"))
+    return results
+
+# The Merkle tree needs a power of 2 leaves. Proofs are per leaf.
+
+def bench_merkle():
+    from merkle import Node, build_tree, validate_tree, merkle_proof, verify_proof
+    results = []
+    for count in (8, 64, 256):
+        data = [f"message {i}" for i in range(count)]
+        build = lambda: build_tree([Node(x) for x in data])
+        root = build()
+        results.append(result("merkle_build", count, measure(build), count, "leaves"))
+        results.append(result("merkle_validate", count,
+                              measure(lambda: validate_tree(root, verbose=False)), count, "leaves"))
+        index = count // 3
+        results.append(result("merkle_proof", count,
+                              measure(lambda: merkle_proof(root, index)), unit="proofs"))
+        proof = merkle_proof(root, index)
+        results.append(result("merkle_verify_proof", count,
+                              measure(lambda: verify_proof(root.hash, data[index], proof)),
+                              unit="proofs"))
+    return results
+
+def bench_rsa():
+    from rsa import sign, verify, hash_sign, hash_verify
+    msg = "No true Scotsman"
+    sig = sign(msg)
+    results = [
+        result("rsa_sign", len(msg), measure(lambda: sign(msg)), unit="sigs"),
+        result("rsa_verify", len(msg), measure(lambda: verify(sig)), unit="sigs"),
+    ]
+    for size in (1024, 65536):
+        data = os.urandom(size)
+        hsig = hash_sign(data)
+        results.append(result("rsa_hash_sign", size, measure(lambda: hash_sign(data)),
+                              unit="sigs"))
+        results.append(result("rsa_hash_verify", size,
+                              measure(lambda: hash_verify(data, hsig)), unit="sigs"))
+    return results
+
+# The whole client/server dance for one message: blind, sign, unblind. The
+# pool is filled up front so we're timing steady state, not the first factors.
+
+def bench_blind():
+    from blind import blind, unblind, blind_sign, BlindingPool
+    pool = BlindingPool().warm()
+
+    def round_trip():
+        blinded, r_i = blind("No true Scotsman", pool)
+        return unblind(blind_sign(blinded), r_i, pool.n)
+
+    results = [result("blind_round_trip", 1, measure(round_trip), unit="msgs")]
+    pool.stop()
+    return results
+
+# Building uses a fresh signature cache every time, so it's the cold cost.
+# Queries go through the full blind signing round trip for 4 elements.
+
+def bench_accumulator():
+    from accumulator import Accumulator, all_people
+    results = []
+    for count in (25, 100):
+        people = all_people[:count]
+        members = people[:count // 2]
+        non_members = people[count // 2:]
+
+        def build():
+            with tempfile.TemporaryDirectory() as cache_dir:
+                return Accumulator(cache_dir=cache_dir).build(members, non_members)
+
+        acc = build()
+        results.append(result("accumulator_build", count, measure(build), count, "elements"))
+        elements = sample(people, k=4)
+        results.append(result("accumulator_query", count,
+                              measure(lambda: acc.query(elements)), 4, "elements"))
+    return results
+
+SECTIONS = {
+    "startup": bench_startup,
+    "md5": bench_md5,
+    "hmac": bench_hmac,
+    "bloom": bench_bloom,
+    "merkle": bench_merkle,
+    "rsa": bench_rsa,
+    "blind": bench_blind,
+    "accumulator": bench_accumulator,
+}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sections):
+    results = []
+    for section in sections:
+        for r in SECTIONS[section]():
+            print(f"{r['benchmark']:<22}\t{r['size']!s:<16}\t{format_result(r)}")
+            results.append(r)
+    return results
+
+if __name__ == "__main__":
+    sections = sys.argv[1:] or list(SECTIONS)
+    for section in sections:
+        if section not in SECTIONS:
+            sys.exit(f"Unknown section {section}, pick from: {' '.join(SECTIONS)}")
+
+    print(f"{'benchmark':<22}\t{'size':<16}\t{'result':>12}")
+    results = run(sections)
+
+    with open(BENCH_OUTPUT, "a") as f:
+        f.write(json.dumps({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "results": results,
+        }) + "\n")
+    print(f"Results appended to {BENCH_OUTPUT}")
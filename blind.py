@@ -1,56 +1,162 @@
 from rsa import N, E, D, encode_string_as_int, decode_int_string, raise_to_e, raise_to_d, verify, sign
-P = 0xF5B2E183392A27F85CBF274A24D2F07301B9619220AF0F6876D5128E2830F98086C5D7182F23615235DC885E8FB8E643D04677FC9DDC7B0764E4E44C707F684D
-Q = 0xE35E6325E49C1B5FFBB6A162E2A43A76138E2A54B5CD7F8B788C5D485D4C4277B87D0FAD15B24A0AE8EBF245F7E0BC592A50AE12886A3D77EE2F50B216D91D55
 
 # never never never never use the normal random package for anything actually
 # related to crypto
 from random import randrange
 
-# Euler's totient function, easy since we know P and Q
-# (used to compute an inverse mod N very quickly, not conceptually important)
-tot = (P-1) * (Q-1)
+import threading
+from collections import deque
+
+import instrument
 
 # Assume here we're on the "client" side, and we want something signed
 # by a "server"
-# Pick a random number, find the inverse via Euler's theorem
-r = randrange(N >> 10, N)
-r_i = pow(r, tot - 1, N)
+# Pick a random number r, and find its inverse. Euler's theorem says
+# r^(phi(N) - 1) is the inverse, where phi(N) = (P-1)(Q-1), but that's a whole
+# 1024 bit exponentiation (and a real client wouldn't know P and Q anyway).
+# pow(r, -1, N) gets the same answer with the extended Euclidean algorithm,
+# which is much cheaper.
+# Then we need to raise r^e, which is "verifying" it. (Encrypting, but w/e)
+
+def new_blinding_factor(n=N, e=E):
+    r = randrange(n >> 10, n)
+    r_i = pow(r, -1, n)
+    re = pow(r, e, n)
+    return r, r_i, re
+
+# Every message we blind needs its own r. If we reused one r, the server could
+# spot the same factor in everything we send and link our requests together.
+# Making a new one still costs an inverse and an exponentiation, though, so
+# we'd like to do that work ahead of time instead of while a request is
+# waiting. A BlindingPool keeps a stack of (r, r_i, re) triples topped up from
+# a background thread, and blind() just takes one off the top.
+
+# Every triple has to come from a brand new r. It's tempting to make the next
+# one cheaply by squaring the last (r^2 still works, since (r^2)^e = (r^e)^2),
+# but then the server sees b1 = m1 * re and b2 = m2 * re^2 and can check
+# b1^2 * m2 == b2 * m1^2 for any pair of names it's curious about. That links
+# (and names) the requests just as surely as reusing r would. Squaring is fine
+# for blinding the server's own private key math against timing attacks,
+# where nobody else sees the factors, but not here.
+
+class BlindingPool:
+    def __init__(self, size=32, n=N, e=E):
+        self.size = size
+        self.n = n
+        self.e = e
+        self.factors = deque()
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def next_factor(self):
+        if instrument.enabled:
+            instrument.count("blind.pool.fresh")
+        return new_blinding_factor(self.n, self.e)
+
+# The background thread just sleeps until the pool dips below full, then tops
+# it back up. (Python only runs one thread at a time, so this doesn't make
+# the math any faster; it moves it to when we're waiting on the server.)
+
+    def refill(self):
+        while True:
+            with self.cond:
+                while len(self.factors) >= self.size and not self.stopped:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+            factor = self.next_factor()
+            with self.cond:
+                self.factors.append(factor)
+
+# Making a pool is free, so importing this file costs nothing. warm() fills it
+# up front (a full pool is a few milliseconds of work, since e is small)
+# and starts the thread that keeps it full, so even the first few requests
+# find a factor waiting. Whatever hands out pools calls it when it makes one.
 
-# Now we need to raise r^e, which is "verifying" it. (Encrypting, but w/e)
-re = raise_to_e(r)
+    def warm(self):
+        with self.cond:
+            missing = self.size - len(self.factors)
+        factors = [self.next_factor() for _ in range(missing)]
+        with self.cond:
+            self.factors.extend(factors)
+        self.start()
+        return self
+
+    def start(self):
+        with self.cond:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.refill, daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+# If the pool ran dry we make a triple right here rather than wait on the
+# thread
+
+    def get(self):
+        self.start()
+        with self.cond:
+            factor = self.factors.popleft() if self.factors else None
+            self.cond.notify()
+        if factor is None:
+            if instrument.enabled:
+                instrument.count("blind.pool.empty")
+            factor = self.next_factor()
+        return factor
+
+default_pool = None
+
+def get_default_pool():
+    global default_pool
+    if default_pool is None:
+        default_pool = BlindingPool().warm()
+    return default_pool
 
 def blind_sign(msg):
-    return raise_to_d(msg)
+    if not instrument.enabled:
+        return raise_to_d(msg)
+    with instrument.timed("blind.blind_sign"):
+        return raise_to_d(msg)
 
 # We know already that sign() is the opposite of verify, so when the "server"
-# signs re the result will be r. Now we mix re in with the message we want:
+# signs re the result will be r. Now we mix re in with the message we want.
+# The client has to hang on to r_i for this message to undo it later, so we
+# hand it back along with the blinded message. With a pool ready, that's just
+# one multiplication.
 
-def blind(msg):
+def blind(msg, pool=None):
+    pool = pool or get_default_pool()
+    r, r_i, re = pool.get()
+    if instrument.enabled:
+        instrument.count("blind.blind")
     msg = encode_string_as_int(msg)
-    return (msg * re) % N
-
-msg = "No true Scotsman"
-blind_msg = blind(msg)
+    return (msg * re) % pool.n, r_i
 
-# Now we sent this message over to the server. The server has the private key,
-# but has no idea what r, r_i, or re are. It can look at the message and sign
-# it:
-signed_blind_msg = blind_sign(blind_msg)
+# Now we send the blinded message over to the server. The server has the
+# private key, but has no idea what r, r_i, or re are. It can look at the
+# message and sign it with blind_sign().
 
 # Pretty much the only thing it can do is to send it back, so let's pretend
 # we're back to the client side with the signed message. Now we need to remove
 # the random stuff we multiplied in earlier. We already calculated the inverse,
 # so now we just multiply by that:
 
-def unblind(msg):
-    return f"{msg * r_i % N:x}"
-
-unblinded_signed_msg = unblind(signed_blind_msg)
+def unblind(msg, r_i, n=N):
+    return f"{msg * r_i % n:x}"
 
 # We end up with the signed message, which we can verify now to make sure that
 # it matches what we originally sent:
 
 if __name__ == "__main__":
+    msg = "No true Scotsman"
+    blind_msg, r_i = blind(msg)
+    signed_blind_msg = blind_sign(blind_msg)
+    unblinded_signed_msg = unblind(signed_blind_msg, r_i)
+
     print("From server's point of view:")
     print("---")
     print(f"Received msg = {blind_msg:x}")
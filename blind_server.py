@@ -0,0 +1,294 @@
+# In accumulator.py the "server" is just a function call: blind_sign() runs in
+# the same process as the client. A real server gets requests over the
+# network from lots of clients at once, so here's a small one built on
+# asyncio.
+#
+# The protocol is one request per line, "<id> <blinded message in hex>", and
+# the server answers with "<id> <blind signature in hex>" (or
+# "<id> error <reason>"). The ids let a client send many requests without
+# waiting, and match the answers up as they come back in whatever order.
+#
+# Signing is all CPU, so doing it inside the event loop would stall every
+# other connection. Instead requests are collected into small batches: the
+# first request starts a very short timer, everything that shows up before it
+# goes off (or until the batch is full) goes together to a pool of worker
+# processes, and the answers get written back as soon as that batch is done.
+# One trip to a worker per batch is a lot cheaper than one per request.
+#
+# Run "python3 blind_server.py serve [port]" for a server, or
+# "python3 blind_server.py bench [clients] [requests]" for the load generator.
+
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from rsa import N, verify
+from blind import blind, unblind, blind_sign
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# A request is an id and a number below N, so a few hundred bytes at most.
+# Anything much longer than that isn't a request, and there's no point
+# buffering it.
+MAX_REQUEST = 1024
+
+def sign_batch(values):
+    return [blind_sign(value) for value in values]
+
+class BlindSignServer:
+    def __init__(self, max_batch=64, max_delay=0.002, processes=None):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.processes = processes or os.cpu_count() or 1
+        self.pool = None
+        self.queue = None
+        self.server = None
+        self.batcher = None
+        self.batch_tasks = set()
+        self.connections = {}
+# Don't hand the workers more batches than they can chew on at once. The
+# rest wait in the queue, where they can be merged into bigger batches.
+        self.in_flight = None
+
+# The worker processes get started before we take any connections. Workers
+# made by forking get a copy of every socket the server has open at the time,
+# and a connection one of them holds on to never really closes: the client
+# would never see it hang up.
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        self.pool = ProcessPoolExecutor(self.processes)
+        await asyncio.get_running_loop().run_in_executor(self.pool, sign_batch, [])
+        self.queue = asyncio.Queue()
+        self.in_flight = asyncio.Semaphore(self.processes * 2)
+        self.batcher = asyncio.create_task(self.run_batches())
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path=path,
+                                                          limit=MAX_REQUEST)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port,
+                                                     limit=MAX_REQUEST)
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.server.wait_closed()
+        self.batcher.cancel()
+        for task in list(self.batch_tasks):
+            task.cancel()
+        self.pool.shutdown()
+
+# Each connection just reads lines and drops them in the shared queue. Bad
+# requests get an error right away instead of going anywhere near the pool.
+# The error carries the request's id whenever there is one, otherwise a
+# client with lots of requests out would never know which one failed.
+# A line that's too long gets thrown away before we can even see its id, and
+# we can't tell where the next request starts, so that one gets a "?" error
+# and the connection is closed. The client then knows every request it still
+# had waiting is never going to be answered.
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            async for line in reader:
+                parts = line.decode("ascii", "backslashreplace").split()
+                request_id = parts[0] if parts else "?"
+                try:
+                    _, value = parts
+                    value = int(value, 16)
+                except ValueError:
+                    writer.write(f"{request_id} error malformed request\n".encode("ascii"))
+                    continue
+                if not 0 < value < N:
+                    writer.write(f"{request_id} error out of range\n".encode("ascii"))
+                    continue
+                await self.queue.put((writer, request_id, value))
+        except ValueError:
+            writer.write(b"? error request too long\n")
+        except ConnectionError:
+            pass
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    async def run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self.in_flight.acquire()
+            task = asyncio.create_task(self.sign_and_reply(batch))
+            self.batch_tasks.add(task)
+            task.add_done_callback(self.batch_tasks.discard)
+
+# If the workers fail (a worker crashing breaks the whole pool, for one),
+# everybody in the batch still gets an answer. Otherwise their clients would
+# wait forever for a reply that's never coming.
+
+    async def sign_and_reply(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            values = [value for _, _, value in batch]
+            signatures = await loop.run_in_executor(self.pool, sign_batch, values)
+            replies = [f"{signature:x}" for signature in signatures]
+        except Exception as e:
+            replies = [f"error signing failed: {type(e).__name__}"] * len(batch)
+        finally:
+            self.in_flight.release()
+
+        writers = set()
+        for (writer, request_id, _), reply in zip(batch, replies):
+            if not writer.is_closing():
+                writer.write(f"{request_id} {reply}\n".encode("ascii"))
+                writers.add(writer)
+        for writer in writers:
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+# The client keeps one connection open and lets any number of requests be
+# outstanding on it. A background task reads answers and hands each one to
+# whoever is waiting on that id.
+
+class BlindSignClient:
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.pending = {}
+        self.next_id = 0
+        self.read_task = None
+
+    async def connect(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        if path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.read_task = asyncio.create_task(self.read_replies())
+        return self
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.read_task
+
+    async def read_replies(self):
+        try:
+            async for line in self.reader:
+                request_id, *rest = line.decode("ascii").split(None, 1)
+                future = self.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                rest = rest[0].strip() if rest else "error empty reply"
+                if rest.startswith("error"):
+                    future.set_exception(ValueError(rest))
+                else:
+                    future.set_result(int(rest, 16))
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+            self.pending.clear()
+
+    async def blind_sign(self, value):
+        request_id = str(self.next_id)
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(f"{request_id} {value:x}\n".encode("ascii"))
+        await self.writer.drain()
+        return await future
+
+# The whole client side round trip: blind, ask the server, unblind. What comes
+# back is the same signature sign() would have made.
+
+    async def sign(self, msg):
+        blinded, r_i = blind(msg)
+        return unblind(await self.blind_sign(blinded), r_i)
+
+# The load generator starts a server in this process, connects some clients,
+# and has every client push its requests through its one connection with many
+# of them in flight at once. The blinding is done before the clock starts so
+# we're only timing the server.
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+async def load_test(num_clients=8, requests_per_client=100, depth=16, path=None):
+    server = BlindSignServer()
+    await server.start(port=0, path=path)
+    port = None if path else server.server.sockets[0].getsockname()[1]
+
+    messages = [f"load test {i}" for i in range(requests_per_client)]
+    blinded = [blind(msg) for msg in messages]
+
+    latencies = []
+
+    async def run_client():
+        client = await BlindSignClient().connect(port=port, path=path)
+        window = asyncio.Semaphore(depth)
+
+        async def one(value):
+            async with window:
+                start = time.perf_counter()
+                await client.blind_sign(value)
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*[one(value) for value, _ in blinded])
+
+        # Spot check that the answers are really signatures
+        value, r_i = blinded[0]
+        assert verify(unblind(await client.blind_sign(value), r_i)) == messages[0]
+        await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run_client() for _ in range(num_clients)])
+    elapsed = time.perf_counter() - start
+    await server.close()
+
+    total = num_clients * requests_per_client
+    return {
+        "clients": num_clients,
+        "requests": total,
+        "seconds": elapsed,
+        "requests_per_second": total / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+async def serve(port):
+    server = BlindSignServer()
+    await server.start(port=port)
+    print(f"Blind signing on {DEFAULT_HOST}:{port}")
+    await server.server.serve_forever()
+
+if __name__ == "__main__":
+    if sys.argv[1] == "serve":
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT
+        asyncio.run(serve(port))
+    if sys.argv[1] == "bench":
+        clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+        requests = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+        result = asyncio.run(load_test(clients, requests))
+        print(f"{result['requests']} requests from {result['clients']} clients "
+              f"in {result['seconds']:.2f}s")
+        print(f"{result['requests_per_second']:.0f} requests/s")
+        print(f"latency p50 {result['p50_ms']:.1f}ms  p95 {result['p95_ms']:.1f}ms  "
+              f"p99 {result['p99_ms']:.1f}ms")
@@ -1,6 +1,7 @@
 # Bloom filters are pretty simple to implement, even though it's a bit hard to
 # wrap your head around.
 
+import instrument
 from md5 import md5
 
 # We need some more hash functions, so let's get creative
@@ -37,6 +38,9 @@ buckets = new_bloom(10000)
 # Inserting into the filter is hashing the value and setting the bits to one
 
 def bloom_insert(val, bloom):
+    if instrument.enabled:
+        instrument.count("bloom.inserts")
+        instrument.count("bloom.probes", len(hs))
     for h in hs:
         index = hti(h(val), len(bloom))
         bloom[index] = 1
@@ -45,12 +49,50 @@ def bloom_insert(val, bloom):
 # seeing if the bits are already set to 1
 
 def bloom_contains(val, bloom):
+    if instrument.enabled:
+        instrument.count("bloom.lookups")
     for h in hs:
+        if instrument.enabled:
+            instrument.count("bloom.probes")
         index = hti(h(val), len(bloom))
         if bloom[index] == 0:
             return False
     return True
 
+# Normal Bloom filters can't forget anything: if we set a bucket back to 0
+# when removing a value, we might be clearing a bit that something else needs
+# too. A counting Bloom filter fixes that by keeping a count in each bucket
+# of how many values landed there. Inserting adds one, removing subtracts
+# one, and a bucket only goes back to "empty" when nobody is using it.
+# bloom_contains works unchanged, since it only cares about zero vs not zero.
+
+def bloom_indices(val, bloom):
+    if instrument.enabled:
+        instrument.count("bloom.probes", len(hs))
+    return [hti(h(val), len(bloom)) for h in hs]
+
+def counting_bloom_insert(val, bloom):
+    for index in bloom_indices(val, bloom):
+        bloom[index] += 1
+
+def counting_bloom_remove(val, bloom):
+    for index in bloom_indices(val, bloom):
+        bloom[index] -= 1
+
+# To save a filter or send it to someone, we pack the buckets into one big
+# number (bucket i is bit i) and write it out in hex
+
+def bloom_to_hex(bloom):
+    packed = 0
+    for i, bit in enumerate(bloom):
+        if bit:
+            packed |= 1 << i
+    return f"{packed:x}"
+
+def bloom_from_hex(packed, num_buckets):
+    packed = int(packed, 16)
+    return [(packed >> i) & 1 for i in range(num_buckets)]
+
 # Let's stick some data in there!
 
 if __name__ == "__main__":
@@ -0,0 +1,173 @@
+# Building the accumulator means one sign() per member, plus one more per
+# non-member just to check for false positives. Each of those is a 1024 bit
+# modular exponentiation, and every run used to redo all of them from scratch
+# even though the names hadn't changed.
+# Two easy wins here:
+# 1. A signature never changes for the same key and message, so we can keep
+# them on disk and only ever sign something once.
+# 2. Signatures don't depend on each other, so whatever is left to sign can be
+# spread across all of the CPUs.
+
+import os
+
+import instrument
+from md5 import md5
+from rsa import sign, raise_to_e, key_fingerprint, encode_string_as_int
+
+# The cache is "content addressed": the file name for a signature is the hash
+# of the key fingerprint and the message, so we never need an index to find
+# anything. Each file just holds the signature in hex.
+# To keep it from growing forever we evict the least recently used entries.
+# Every hit touches the file, so the modification time doubles as the
+# "last used" time and the oldest files are the ones to drop.
+# A file that's empty or isn't hex (a crash, a full disk, someone poking
+# around) counts as a miss, so it just gets signed again and overwritten.
+
+DEFAULT_CACHE_DIR = "sig_cache"
+
+class SignatureCache:
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(path, exist_ok=True)
+        self.num_entries = len(os.listdir(path))
+
+    def entry_path(self, fingerprint, msg):
+        return os.path.join(self.path, md5(f"{fingerprint}\0{msg}"))
+
+    def get(self, fingerprint, msg):
+        path = self.entry_path(fingerprint, msg)
+        try:
+            with open(path) as f:
+                sig = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            int(sig, 16)
+        except ValueError:
+            return None
+        os.utime(path)
+        return sig
+
+    def put(self, fingerprint, msg, sig):
+        path = self.entry_path(fingerprint, msg)
+        if not os.path.exists(path):
+            self.num_entries += 1
+# Write somewhere else first and then rename, so a crash (or another process
+# reading at the same time) never sees half a signature
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(sig)
+        os.replace(tmp, path)
+
+        if self.num_entries > self.max_entries:
+            self.evict()
+
+# Evicting one file at a time would mean listing the directory on every put,
+# so once we're over the limit we clear out a tenth of the cache at once.
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                pass
+        entries.sort()
+
+        target = self.max_entries * 9 // 10
+        for _, path in entries[:max(0, len(entries) - target)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.num_entries = min(len(entries), target)
+
+# Starting worker processes isn't free, so a handful of signatures are faster
+# to just do here. Where we can, we ask for "fork" workers, which start a lot
+# faster than "spawn" ones that have to re-import everything first.
+# multiprocessing and concurrent.futures take longer to import than the rest
+# of this repo put together, so they only get imported once we need a pool.
+
+MIN_PARALLEL = 16
+
+def pool_context():
+    import multiprocessing
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+# Each worker has its own copy of instrument.py's counters, which would be
+# thrown away with the worker. So when instrumentation is on, workers sign a
+# whole chunk at a time, starting from empty counters, and send back what they
+# recorded along with the signatures. That gets added to ours.
+
+def sign_chunk(signer, msgs):
+    instrument.enable()
+    instrument.reset()
+    sigs = [signer(msg) for msg in msgs]
+    return sigs, instrument.counters, instrument.histograms
+
+def sign_all(msgs, processes=None, signer=sign):
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(msgs) < MIN_PARALLEL:
+        return [signer(msg) for msg in msgs]
+
+# Hand out work in a few chunks per worker, so they don't spend all their
+# time passing single names back and forth
+    chunksize = max(1, len(msgs) // (processes * 4))
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(processes, mp_context=pool_context()) as pool:
+        if not instrument.enabled:
+            return list(pool.map(signer, msgs, chunksize=chunksize))
+
+        from functools import partial
+        chunks = [msgs[i:i + chunksize] for i in range(0, len(msgs), chunksize)]
+        sigs = []
+        for chunk_sigs, counters, histograms in pool.map(partial(sign_chunk, signer), chunks):
+            sigs.extend(chunk_sigs)
+            instrument.merge(counters, histograms)
+        return sigs
+
+# Finally, the part everyone else uses. Signatures come back in the same order
+# as the messages, and only the ones the cache doesn't know about get signed.
+# Pass a key from keyring.py to sign with something other than rsa.py's key.
+# Anything from the cache gets checked before we trust it. A wrong signature
+# here would go straight into a Bloom filter without anyone noticing, and
+# with e = 65537 checking is only 17 multiplications, next to nothing
+# compared to signing.
+
+def check_signature(sig, msg, raise_to_e=raise_to_e):
+    return raise_to_e(int(sig, 16)) == encode_string_as_int(msg)
+
+def sign_many(msgs, cache=None, processes=None, key=None):
+    msgs = list(msgs)
+    fingerprint = key.key_id if key is not None else key_fingerprint()
+    signer = key.sign if key is not None else sign
+    check = key.raise_to_e if key is not None else raise_to_e
+
+    sigs = {}
+    missing = []
+    for msg in msgs:
+        if msg in sigs:
+            continue
+        sig = cache.get(fingerprint, msg) if cache is not None else None
+        if sig is not None and not check_signature(sig, msg, check):
+            sig = None
+        sigs[msg] = sig
+        if sig is None:
+            missing.append(msg)
+
+    for msg, sig in zip(missing, sign_all(missing, processes, signer)):
+        sigs[msg] = sig
+        if cache is not None:
+            cache.put(fingerprint, msg, sig)
+
+    return [sigs[msg] for msg in msgs]
+
+# Sign whatever is passed on the CLI, one per line, using the default cache
+if __name__ == "__main__":
+    import sys
+    for sig in sign_many(sys.argv[1:], SignatureCache()):
+        print(sig)
@@ -0,0 +1,134 @@
+# Counting and timing hooks for the crypto pieces, for when we want to know
+# where the time actually goes: how many MD5 blocks a Bloom lookup hashed, how
+# many exponentiations building the accumulator took, how long blind_sign
+# calls are taking, and so on.
+#
+# It's all off unless someone turns it on, either with enable() or by setting
+# TOUR_INSTRUMENT=1 in the environment. Every hook in the other files checks
+# instrument.enabled before doing anything else, so when it's off the only
+# cost is looking up that one flag.
+#
+# Two kinds of things get recorded:
+# - counters: a running total for each name ("md5.blocks", "bloom.lookups")
+# - histograms: how long each call to something took. Rather than keeping
+# every time, we just count how many fell into each power of two number of
+# microseconds (up to 1us, up to 2us, up to 4us, ...), plus the total and the
+# slowest one.
+#
+# Updates aren't locked, so two threads hitting the same counter at the same
+# moment might lose a count. That's fine for getting a picture of things.
+
+import json
+import os
+import time
+
+enabled = os.environ.get("TOUR_INSTRUMENT") == "1"
+
+counters = {}
+histograms = {}
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    counters.clear()
+    histograms.clear()
+
+def count(name, n=1):
+    counters[name] = counters.get(name, 0) + n
+
+def observe(name, seconds):
+    micros = int(seconds * 1e6)
+    bucket = 1 << micros.bit_length()
+    hist = histograms.get(name)
+    if hist is None:
+        hist = histograms[name] = {"count": 0, "total_seconds": 0.0,
+                                   "max_seconds": 0.0, "buckets": {}}
+    hist["count"] += 1
+    hist["total_seconds"] += seconds
+    hist["max_seconds"] = max(hist["max_seconds"], seconds)
+    hist["buckets"][bucket] = hist["buckets"].get(bucket, 0) + 1
+
+# Add in counters and histograms recorded somewhere else, like a worker
+# process (see bulk_sign.py)
+
+def merge(other_counters, other_histograms):
+    for name, n in other_counters.items():
+        count(name, n)
+    for name, other in other_histograms.items():
+        hist = histograms.get(name)
+        if hist is None:
+            hist = histograms[name] = {"count": 0, "total_seconds": 0.0,
+                                       "max_seconds": 0.0, "buckets": {}}
+        hist["count"] += other["count"]
+        hist["total_seconds"] += other["total_seconds"]
+        hist["max_seconds"] = max(hist["max_seconds"], other["max_seconds"])
+        for bucket, n in other["buckets"].items():
+            hist["buckets"][bucket] = hist["buckets"].get(bucket, 0) + n
+
+# Wrap something in "with timed(name):" to count it and time it
+
+class timed:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        count(self.name)
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+# A copy of everything so far, safe to hold on to or turn into JSON
+
+def snapshot():
+    return {
+        "counters": dict(counters),
+        "histograms": {
+            name: {
+                "count": hist["count"],
+                "total_seconds": hist["total_seconds"],
+                "max_seconds": hist["max_seconds"],
+                "buckets_us": {f"<={bucket}": n for bucket, n in sorted(hist["buckets"].items())},
+            }
+            for name, hist in histograms.items()
+        },
+    }
+
+def format_snapshot(snap=None):
+    snap = snap or snapshot()
+    lines = []
+    for name, value in sorted(snap["counters"].items()):
+        lines.append(f"{name:<30}\t{value}")
+    for name, hist in sorted(snap["histograms"].items()):
+        mean = hist["total_seconds"] / hist["count"] * 1e6
+        lines.append(f"{name:<30}\tcount={hist['count']} mean={mean:.1f}us "
+                     f"max={hist['max_seconds'] * 1e6:.1f}us")
+        for bucket, n in hist["buckets_us"].items():
+            lines.append(f"  {bucket + 'us':<28}\t{n}")
+    return "\n".join(lines) + "\n"
+
+def dump(path, as_json=False):
+    with open(path, "w") as f:
+        if as_json:
+            json.dump(snapshot(), f, indent=2)
+        else:
+            f.write(format_snapshot())
+
+# Turn it on, run the accumulator example, and see what it did
+# (Running this file makes it __main__, so we go through "import instrument"
+# to flip the same switch the other files look at.)
+if __name__ == "__main__":
+    import runpy
+    import instrument
+    instrument.enable()
+    runpy.run_module("accumulator", run_name="__main__")
+    print()
+    print(instrument.format_snapshot(), end="")
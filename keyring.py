@@ -0,0 +1,270 @@
+# rsa.py has exactly one key, copied by hand out of parsed_private_key.txt.
+# That's fine for learning, but a real server needs to change keys every so
+# often ("rotating" them), and it can't just throw away everything signed with
+# the old key the moment a new one shows up. So here's a keyring: it holds
+# several keys, knows which one new signatures should use, and keeps the old
+# ones around so anything made with them still works.
+#
+# Every key gets an ID (the fingerprint from rsa.key_fingerprint), and
+# signatures from the keyring look like "<key id>:<signature>" so we always
+# know which key to check them with. Saved accumulators remember their key ID
+# too.
+#
+# Keys are read straight from the PEM files that gen_key makes, so there's no
+# more copying numbers around by hand.
+#
+# Anything expensive to set up for a key only happens the first time it's
+# used, so loading a keyring full of keys at startup is cheap:
+# - CRT values. If we know P and Q, raising to d can be done mod P and mod Q
+# separately (numbers half the size, with exponents half the size) and glued
+# back together, which is around 3 times faster than pow(x, d, N).
+# - A BlindingPool of blinding factors for the key, filled up when it's made.
+
+import base64
+from functools import cached_property
+
+import instrument
+from rsa import (N, E, D, P, Q, key_fingerprint, encode_string_as_int, decode_int_string,
+                 encode_digest, digest_of)
+from blind import BlindingPool
+
+# PEM files are just base64 wrapped in BEGIN/END lines. Inside is DER, which
+# is a list of (type, length, value) triples where the value can itself hold
+# more triples. We only need to read the handful of types RSA keys use:
+# SEQUENCE, INTEGER, BIT STRING and OCTET STRING.
+
+SEQUENCE = 0x30
+INTEGER = 0x02
+BIT_STRING = 0x03
+OCTET_STRING = 0x04
+
+def read_pem(text):
+    lines = text.strip().splitlines()
+    label = lines[0].strip("-").replace("BEGIN ", "")
+    body = "".join(line for line in lines[1:] if not line.startswith("-----"))
+    return label, base64.b64decode(body)
+
+def read_der(data):
+    items = []
+    offset = 0
+    while offset < len(data):
+        tag = data[offset]
+        length = data[offset + 1]
+        offset += 2
+# Lengths over 127 are written as "the next n bytes are the length"
+        if length & 0x80:
+            num_bytes = length & 0x7F
+            length = int.from_bytes(data[offset:offset + num_bytes], byteorder="big")
+            offset += num_bytes
+        items.append((tag, data[offset:offset + length]))
+        offset += length
+    return items
+
+def read_sequence(data):
+    (tag, body), = read_der(data)
+    if tag != SEQUENCE:
+        raise ValueError("expected a DER sequence")
+    return read_der(body)
+
+def read_integers(data):
+    return [int.from_bytes(value, byteorder="big")
+            for tag, value in read_sequence(data) if tag == INTEGER]
+
+# There are a few different ways keys get wrapped up. "RSA PRIVATE KEY" is
+# the layout in parsed_private_key.txt: version, n, e, d, p, q, then the CRT
+# values. "PRIVATE KEY" is the same thing tucked inside an OCTET STRING along
+# with a note saying it's RSA. Public keys are just n and e, either bare
+# ("RSA PUBLIC KEY") or inside a BIT STRING ("PUBLIC KEY", what gen_key
+# writes to public_key).
+
+def parse_pem(text):
+    label, der = read_pem(text)
+    if label == "RSA PRIVATE KEY":
+        _, n, e, d, p, q = read_integers(der)[:6]
+        return Key(n, e, d, p, q)
+    if label == "PRIVATE KEY":
+        inner = [value for tag, value in read_sequence(der) if tag == OCTET_STRING]
+        _, n, e, d, p, q = read_integers(inner[0])[:6]
+        return Key(n, e, d, p, q)
+    if label == "RSA PUBLIC KEY":
+        n, e = read_integers(der)
+        return Key(n, e)
+    if label == "PUBLIC KEY":
+        inner = [value for tag, value in read_sequence(der) if tag == BIT_STRING]
+# The first byte of a BIT STRING says how many bits of padding are at the end
+        n, e = read_integers(inner[0][1:])
+        return Key(n, e)
+    raise ValueError(f"don't know how to read a {label}")
+
+def load_pem(path):
+    with open(path) as f:
+        return parse_pem(f.read())
+
+# A Key is one key pair (or just the public half, which can verify but not
+# sign). The sign/verify functions match the ones in rsa.py, just for this
+# key instead of the hardcoded one.
+
+class Key:
+    def __init__(self, n, e, d=None, p=None, q=None):
+        self.n = n
+        self.e = e
+        self.d = d
+        self.p = p
+        self.q = q
+        self.key_id = key_fingerprint(n, e)
+
+# Only the numbers get sent to other processes (see bulk_sign.py). Anything
+# cached gets worked out again over there when it's needed.
+
+    def __reduce__(self):
+        return (Key, (self.n, self.e, self.d, self.p, self.q))
+
+    def __repr__(self):
+        return f"Key({self.key_id})"
+
+    @cached_property
+    def crt(self):
+        if self.p is None or self.q is None:
+            return None
+        dp = self.d % (self.p - 1)
+        dq = self.d % (self.q - 1)
+        q_inv = pow(self.q, -1, self.p)
+        return dp, dq, q_inv
+
+    @cached_property
+    def blinding_pool(self):
+        return BlindingPool(n=self.n, e=self.e).warm()
+
+    def raise_to_d(self, i):
+        if not instrument.enabled:
+            return self.private_power(i)
+        with instrument.timed("rsa.raise_to_d"):
+            return self.private_power(i)
+
+    def private_power(self, i):
+        if self.d is None:
+            raise ValueError(f"key {self.key_id} is public only and can't sign")
+        if self.crt is None:
+            return pow(i, self.d, self.n)
+# Raise to d mod p and mod q, then stitch the two answers back together
+        dp, dq, q_inv = self.crt
+        m1 = pow(i, dp, self.p)
+        m2 = pow(i, dq, self.q)
+        h = q_inv * (m1 - m2) % self.p
+        return m2 + h * self.q
+
+    def raise_to_e(self, i):
+        if not instrument.enabled:
+            return pow(i, self.e, self.n)
+        with instrument.timed("rsa.raise_to_e"):
+            return pow(i, self.e, self.n)
+
+    def sign(self, msg):
+        msg = encode_string_as_int(msg)
+        if msg >= self.n:
+            raise ValueError("message is too long to sign directly, use hash_sign")
+        return f"{self.raise_to_d(msg):x}"
+
+    def verify(self, sig):
+        return decode_int_string(self.raise_to_e(int(sig, 16)))
+
+    def blind_sign(self, msg):
+        if not instrument.enabled:
+            return self.raise_to_d(msg)
+        with instrument.timed("blind.blind_sign"):
+            return self.raise_to_d(msg)
+
+    def hash_sign(self, msg):
+        return f"{self.raise_to_d(encode_digest(digest_of(msg), self.n)):x}"
+
+    def hash_verify(self, msg, sig):
+        return self.raise_to_e(int(sig, 16)) == encode_digest(digest_of(msg), self.n)
+
+# The keyring itself. New signatures always use the active key; rotating just
+# switches which key that is. Old keys stay on the ring, so signatures and
+# accumulators made with them keep working while everything moves over to
+# the new one.
+
+class Keyring:
+    def __init__(self, keys=()):
+        self.keys = {}
+        self.active_id = None
+        for key in keys:
+            self.add(key)
+
+    def add(self, key, activate=False):
+        self.keys[key.key_id] = key
+        if activate or self.active_id is None:
+            self.active_id = key.key_id
+        return key
+
+    def load_pem(self, path, activate=False):
+        return self.add(load_pem(path), activate)
+
+    def get(self, key_id):
+        try:
+            return self.keys[key_id]
+        except KeyError:
+            raise KeyError(f"no key {key_id} in the keyring") from None
+
+    @property
+    def active(self):
+        if self.active_id is None:
+            raise ValueError("the keyring is empty")
+        return self.keys[self.active_id]
+
+    def rotate(self, key):
+        if not isinstance(key, Key):
+            key = self.get(key)
+        return self.add(key, activate=True)
+
+    def retire(self, key_id):
+        if key_id == self.active_id:
+            raise ValueError("can't retire the active key, rotate first")
+        del self.keys[key_id]
+
+# Signatures carry their key ID, so checking one finds the right key itself
+
+    def split(self, tagged):
+        key_id, sig = tagged.split(":", 1)
+        return self.get(key_id), sig
+
+    def sign(self, msg):
+        key = self.active
+        return f"{key.key_id}:{key.sign(msg)}"
+
+    def verify(self, tagged):
+        key, sig = self.split(tagged)
+        return key.verify(sig)
+
+    def hash_sign(self, msg):
+        key = self.active
+        return f"{key.key_id}:{key.hash_sign(msg)}"
+
+    def hash_verify(self, msg, tagged):
+        key, sig = self.split(tagged)
+        return key.hash_verify(msg, sig)
+
+# The keyring everything uses unless told otherwise, holding the same key
+# rsa.py has always used
+
+default = None
+
+def default_keyring():
+    global default
+    if default is None:
+        default = Keyring([Key(N, E, D, P, Q)])
+    return default
+
+# Sign or check with any number of PEM files, the first one being active:
+# python3 keyring.py sign "message" private_key [other_key ...]
+# python3 keyring.py verify "<key id>:<signature>" private_key [other_key ...]
+if __name__ == "__main__":
+    import sys
+    ring = Keyring()
+    for path in sys.argv[3:]:
+        ring.load_pem(path)
+    if sys.argv[1] == "sign":
+        print(ring.sign(sys.argv[2]))
+    if sys.argv[1] == "verify":
+        print(ring.verify(sys.argv[2]))
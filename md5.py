@@ -3,6 +3,8 @@
 # a Python file. It's done this way for ease of following along.
 # See https://www.ietf.org/rfc/rfc1321.txt
 
+import instrument
+
 # 3.1 Append Padding Bits
 
 def bitcount(m):
@@ -108,6 +110,12 @@ def md5(message):
 
     num_big_chunks = bitcount(padded_message) // 512
 
+# (If instrumentation is on, keep track of how much hashing we're doing.)
+    if instrument.enabled:
+        instrument.count("md5.calls")
+        instrument.count("md5.bytes", len(message))
+        instrument.count("md5.blocks", num_big_chunks)
+
 # Now we get this piece of work:
 # Let [abcd k s i] denote the operation a = b + ((a + F(b,c,d) + X[k] + T[i]) <<< s).
 # That just means we have a function of 7 values. The first four are the buffer
@@ -127,33 +135,42 @@ def md5(message):
 # With that done it's just a matter of writing down all of these calls, so let's get to it
 
     for i in range(num_big_chunks):
-        # Split the 512 bit chunk into 4 byte pieces
-        chunk = padded_message[i*64:i*64+64]
-        X = [int.from_bytes(chunk[j*4:(j+1)*4], byteorder="little") for j in range(16)]
+        a, b, c, d = process_block(a, b, c, d, padded_message[i*64:i*64+64])
+
+    return to_hex(a, b, c, d)
+
+# Every 512 bit block gets exactly the same treatment, so the work for one
+# block lives in its own function. That also means the blocks don't have to
+# come from one big padded message; md5_stream further down feeds blocks in
+# straight from a file.
+
+def process_block(a, b, c, d, chunk):
+    # Split the 512 bit chunk into 4 byte pieces
+    X = [int.from_bytes(chunk[j*4:(j+1)*4], byteorder="little") for j in range(16)]
 # Before we start processing, we save the current values of the registers for later
-        aa = a
-        bb = b
-        cc = c
-        dd = d
+    aa = a
+    bb = b
+    cc = c
+    dd = d
 
 
 # Round 1
-        a = round(a, b, c, d, F, X, 0,  7,  1)
-        d = round(d, a, b, c, F, X, 1,  12, 2)
-        c = round(c, d, a, b, F, X, 2,  17, 3)
-        b = round(b, c, d, a, F, X, 3,  22, 4)
-        a = round(a, b, c, d, F, X, 4,  7,  5)
-        d = round(d, a, b, c, F, X, 5,  12, 6)
-        c = round(c, d, a, b, F, X, 6,  17, 7)
-        b = round(b, c, d, a, F, X, 7,  22, 8)
-        a = round(a, b, c, d, F, X, 8,  7,  9)
-        d = round(d, a, b, c, F, X, 9,  12, 10)
-        c = round(c, d, a, b, F, X, 10, 17, 11)
-        b = round(b, c, d, a, F, X, 11, 22, 12)
-        a = round(a, b, c, d, F, X, 12, 7,  13)
-        d = round(d, a, b, c, F, X, 13, 12, 14)
-        c = round(c, d, a, b, F, X, 14, 17, 15)
-        b = round(b, c, d, a, F, X, 15, 22, 16)
+    a = round(a, b, c, d, F, X, 0,  7,  1)
+    d = round(d, a, b, c, F, X, 1,  12, 2)
+    c = round(c, d, a, b, F, X, 2,  17, 3)
+    b = round(b, c, d, a, F, X, 3,  22, 4)
+    a = round(a, b, c, d, F, X, 4,  7,  5)
+    d = round(d, a, b, c, F, X, 5,  12, 6)
+    c = round(c, d, a, b, F, X, 6,  17, 7)
+    b = round(b, c, d, a, F, X, 7,  22, 8)
+    a = round(a, b, c, d, F, X, 8,  7,  9)
+    d = round(d, a, b, c, F, X, 9,  12, 10)
+    c = round(c, d, a, b, F, X, 10, 17, 11)
+    b = round(b, c, d, a, F, X, 11, 22, 12)
+    a = round(a, b, c, d, F, X, 12, 7,  13)
+    d = round(d, a, b, c, F, X, 13, 12, 14)
+    c = round(c, d, a, b, F, X, 14, 17, 15)
+    b = round(b, c, d, a, F, X, 15, 22, 16)
 
 # Let's look at this one round. You can see that every word in the buffer is
 # getting mixed together with every other word multiple times, which increases
@@ -175,75 +192,77 @@ def md5(message):
 # Enough talk, let's get on with it.
 
 # Round 2
-        a = round(a, b, c, d, G, X, 1,  5,  17)
-        d = round(d, a, b, c, G, X, 6,  9,  18)
-        c = round(c, d, a, b, G, X, 11, 14, 19)
-        b = round(b, c, d, a, G, X, 0,  20, 20)
-        a = round(a, b, c, d, G, X, 5,  5,  21)
-        d = round(d, a, b, c, G, X, 10, 9,  22)
-        c = round(c, d, a, b, G, X, 15, 14, 23)
-        b = round(b, c, d, a, G, X, 4,  20, 24)
-        a = round(a, b, c, d, G, X, 9,  5,  25)
-        d = round(d, a, b, c, G, X, 14, 9,  26)
-        c = round(c, d, a, b, G, X, 3,  14, 27)
-        b = round(b, c, d, a, G, X, 8,  20, 28)
-        a = round(a, b, c, d, G, X, 13, 5,  29)
-        d = round(d, a, b, c, G, X, 2,  9,  30)
-        c = round(c, d, a, b, G, X, 7,  14, 31)
-        b = round(b, c, d, a, G, X, 12, 20, 32)
+    a = round(a, b, c, d, G, X, 1,  5,  17)
+    d = round(d, a, b, c, G, X, 6,  9,  18)
+    c = round(c, d, a, b, G, X, 11, 14, 19)
+    b = round(b, c, d, a, G, X, 0,  20, 20)
+    a = round(a, b, c, d, G, X, 5,  5,  21)
+    d = round(d, a, b, c, G, X, 10, 9,  22)
+    c = round(c, d, a, b, G, X, 15, 14, 23)
+    b = round(b, c, d, a, G, X, 4,  20, 24)
+    a = round(a, b, c, d, G, X, 9,  5,  25)
+    d = round(d, a, b, c, G, X, 14, 9,  26)
+    c = round(c, d, a, b, G, X, 3,  14, 27)
+    b = round(b, c, d, a, G, X, 8,  20, 28)
+    a = round(a, b, c, d, G, X, 13, 5,  29)
+    d = round(d, a, b, c, G, X, 2,  9,  30)
+    c = round(c, d, a, b, G, X, 7,  14, 31)
+    b = round(b, c, d, a, G, X, 12, 20, 32)
 
 # i keeps going up, the rotation sticks with the same buffer again but changes
 # a bit, and which 32 bit chunk of the message we're looking at is a completely
 # different order. Round 3 and 4 are similar.
 
 # Round 3
-        a = round(a, b, c, d, H, X, 5,  4,  33)
-        d = round(d, a, b, c, H, X, 8,  11, 34)
-        c = round(c, d, a, b, H, X, 11, 16, 35)
-        b = round(b, c, d, a, H, X, 14, 23, 36)
-        a = round(a, b, c, d, H, X, 1,  4,  37)
-        d = round(d, a, b, c, H, X, 4,  11, 38)
-        c = round(c, d, a, b, H, X, 7,  16, 39)
-        b = round(b, c, d, a, H, X, 10, 23, 40)
-        a = round(a, b, c, d, H, X, 13, 4,  41)
-        d = round(d, a, b, c, H, X, 0,  11, 42)
-        c = round(c, d, a, b, H, X, 3,  16, 43)
-        b = round(b, c, d, a, H, X, 6,  23, 44)
-        a = round(a, b, c, d, H, X, 9,  4,  45)
-        d = round(d, a, b, c, H, X, 12, 11, 46)
-        c = round(c, d, a, b, H, X, 15, 16, 47)
-        b = round(b, c, d, a, H, X, 2,  23, 48)
+    a = round(a, b, c, d, H, X, 5,  4,  33)
+    d = round(d, a, b, c, H, X, 8,  11, 34)
+    c = round(c, d, a, b, H, X, 11, 16, 35)
+    b = round(b, c, d, a, H, X, 14, 23, 36)
+    a = round(a, b, c, d, H, X, 1,  4,  37)
+    d = round(d, a, b, c, H, X, 4,  11, 38)
+    c = round(c, d, a, b, H, X, 7,  16, 39)
+    b = round(b, c, d, a, H, X, 10, 23, 40)
+    a = round(a, b, c, d, H, X, 13, 4,  41)
+    d = round(d, a, b, c, H, X, 0,  11, 42)
+    c = round(c, d, a, b, H, X, 3,  16, 43)
+    b = round(b, c, d, a, H, X, 6,  23, 44)
+    a = round(a, b, c, d, H, X, 9,  4,  45)
+    d = round(d, a, b, c, H, X, 12, 11, 46)
+    c = round(c, d, a, b, H, X, 15, 16, 47)
+    b = round(b, c, d, a, H, X, 2,  23, 48)
 
 # Round 4
-        a = round(a, b, c, d, I, X, 0,  6,  49)
-        d = round(d, a, b, c, I, X, 7,  10, 50)
-        c = round(c, d, a, b, I, X, 14, 15, 51)
-        b = round(b, c, d, a, I, X, 5,  21, 52)
-        a = round(a, b, c, d, I, X, 12, 6,  53)
-        d = round(d, a, b, c, I, X, 3,  10, 54)
-        c = round(c, d, a, b, I, X, 10, 15, 55)
-        b = round(b, c, d, a, I, X, 1,  21, 56)
-        a = round(a, b, c, d, I, X, 8,  6,  57)
-        d = round(d, a, b, c, I, X, 15, 10, 58)
-        c = round(c, d, a, b, I, X, 6,  15, 59)
-        b = round(b, c, d, a, I, X, 13, 21, 60)
-        a = round(a, b, c, d, I, X, 4,  6,  61)
-        d = round(d, a, b, c, I, X, 11, 10, 62)
-        c = round(c, d, a, b, I, X, 2,  15, 63)
-        b = round(b, c, d, a, I, X, 9,  21, 64)
+    a = round(a, b, c, d, I, X, 0,  6,  49)
+    d = round(d, a, b, c, I, X, 7,  10, 50)
+    c = round(c, d, a, b, I, X, 14, 15, 51)
+    b = round(b, c, d, a, I, X, 5,  21, 52)
+    a = round(a, b, c, d, I, X, 12, 6,  53)
+    d = round(d, a, b, c, I, X, 3,  10, 54)
+    c = round(c, d, a, b, I, X, 10, 15, 55)
+    b = round(b, c, d, a, I, X, 1,  21, 56)
+    a = round(a, b, c, d, I, X, 8,  6,  57)
+    d = round(d, a, b, c, I, X, 15, 10, 58)
+    c = round(c, d, a, b, I, X, 6,  15, 59)
+    b = round(b, c, d, a, I, X, 13, 21, 60)
+    a = round(a, b, c, d, I, X, 4,  6,  61)
+    d = round(d, a, b, c, I, X, 11, 10, 62)
+    c = round(c, d, a, b, I, X, 2,  15, 63)
+    b = round(b, c, d, a, I, X, 9,  21, 64)
 
 # Finally at the end of each 512 bit block, we take the values we saved way at
 # the beginning of the loop and add them again. Let's also make sure that we
 # don't go over 32 bits.
 
-        a += aa
-        b += bb
-        c += cc
-        d += dd
-        a &= 0xFFFFFFFF
-        b &= 0xFFFFFFFF
-        c &= 0xFFFFFFFF
-        d &= 0xFFFFFFFF
+    a += aa
+    b += bb
+    c += cc
+    d += dd
+    a &= 0xFFFFFFFF
+    b &= 0xFFFFFFFF
+    c &= 0xFFFFFFFF
+    d &= 0xFFFFFFFF
+
+    return a, b, c, d
 
 # And after we process everything, we're done! Almost. We still have:
 # 3.5 Output
@@ -252,6 +271,7 @@ def md5(message):
 # everything as a hexadecimal string. Since every 2 characters in hex is
 # one byte, we can just take every two characters and reverse it that way.
 
+def to_hex(a, b, c, d):
     a_hex = f"{a:0{8}x}"
     b_hex = f"{b:0{8}x}"
     c_hex = f"{c:0{8}x}"
@@ -283,6 +303,45 @@ def rotate(x, s):
 def round(a, b, c, d, func, X, k, s, i):
     return (b + (rotate((a + func(b, c, d) + X[k] + T[i-1]), s)))
 
+# md5() above wants the whole message in memory so it can pad it. That's fine
+# for names, but not for a multi-megabyte file. Since the padding only ever
+# touches the last block, we can read the input a piece at a time, run every
+# full 64 byte block through process_block as soon as we have it, and only
+# pad whatever is left over at the very end. The answer is exactly the same.
+
+def md5_stream(stream, read_size=65536):
+    a, b, c, d = init_buffer()
+    leftover = b""
+    total_len = 0
+
+    while True:
+        piece = stream.read(read_size)
+        if not piece:
+            break
+# Text mode files hand us strings, so treat them the same way md5() does
+        try:
+            piece = piece.encode()
+        except AttributeError:
+            pass
+
+        total_len += len(piece)
+        data = leftover + piece
+        full = len(data) - len(data) % 64
+        for i in range(0, full, 64):
+            a, b, c, d = process_block(a, b, c, d, data[i:i+64])
+        leftover = data[full:]
+
+    tail = append_length(pad(leftover), total_len * 8)
+    for i in range(0, len(tail), 64):
+        a, b, c, d = process_block(a, b, c, d, tail[i:i+64])
+
+    if instrument.enabled:
+        instrument.count("md5.calls")
+        instrument.count("md5.bytes", total_len)
+        instrument.count("md5.blocks", (total_len - len(leftover)) // 64 + len(tail) // 64)
+
+    return to_hex(a, b, c, d)
+
 # Let's take an argument from the CLI and hash it
 if __name__ == "__main__":
     import sys
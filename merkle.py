@@ -1,10 +1,13 @@
 # This is a simple implementation of a Merkle tree using the md5 function that
 # we made earlier. 
+import instrument
 from md5 import md5
 
 class Node:
     def __init__(self, val="", left=None, right=None):
         self.hash = md5(val)
+        if instrument.enabled:
+            instrument.count("merkle.nodes")
         self.left = left
         self.right = right
 
@@ -20,7 +23,8 @@ important_data = [
     "(waooooo!)",
 ]
 
-leaf_nodes = [Node(data) for data in important_data]
+if __name__ == "__main__":
+    leaf_nodes = [Node(data) for data in important_data]
 
 # We'll build the tree starting with the leaves and hashing them in pairs
 # until we're only at 1 node. (I'm lazy so this only works of the number of
@@ -39,12 +43,15 @@ def build_tree(list_of_data):
 
     return cur[0]
 
-root = build_tree(leaf_nodes)
+if __name__ == "__main__":
+    root = build_tree(leaf_nodes)
 
 
 # Now let's validate the tree.
 
-def validate_tree(root):
+def validate_tree(root, verbose=True):
+    if instrument.enabled:
+        instrument.count("merkle.validations")
     stack = [root]
     while stack:
         cur = stack.pop()
@@ -55,22 +62,27 @@ def validate_tree(root):
 
         target_hash = md5(val)
         if target_hash != cur.hash:
-            print(f"Failed validation! Wanted {cur.hash} got {target_hash}")
+            if verbose:
+                print(f"Failed validation! Wanted {cur.hash} got {target_hash}")
             return False
 
         stack.append(cur.left)
         stack.append(cur.right)
 
-    print("Passed validation!")
+    if verbose:
+        print("Passed validation!")
     return True
 
-validate_tree(root)
+if __name__ == "__main__":
+    validate_tree(root)
 # This should have printed "Passed validation!"
 
 # Let's fidget with some data and see if it still validates
 
-leaf_nodes[0].hash = "Parappa comin' atcha"
-validate_tree(root)
+    original_hash = leaf_nodes[0].hash
+    leaf_nodes[0].hash = "Parappa comin' atcha"
+    validate_tree(root)
+    leaf_nodes[0].hash = original_hash
 
 # This should have printed 
 # "Failed validation! Wanted 90738f360feb773740705eef9a919e5a got 9842743baba713aadab974a1bc09a1d0"
@@ -78,11 +90,12 @@ validate_tree(root)
 # If you imagine that you're about to download a bunch of files from a server,
 # you might first get the root hash:
 
-root_hash = root.hash
+if __name__ == "__main__":
+    root_hash = root.hash
 
 # Now you download a bunch of stuff, but a message gets corrupted.
 
-important_data = [
+corrupted_data = [
     "Say Ho",
     "(Ho)",
     "Say Ho Ho",
@@ -96,12 +109,13 @@ important_data = [
 
 # We can build the tree ourselves and see if it checks out:
 
-leaf_nodes = [Node(data) for data in important_data]
+if __name__ == "__main__":
+    leaf_nodes = [Node(data) for data in corrupted_data]
 
-root_again = build_tree(leaf_nodes)
+    root_again = build_tree(leaf_nodes)
 
-print(f"Got {root.hash} from server")
-print(f"Computed {root_again.hash} locally")
+    print(f"Got {root.hash} from server")
+    print(f"Computed {root_again.hash} locally")
 
 # Well shoot. How do we know which one got an error?
 # One way: we can ask the server for the left and right hashes for a node.
@@ -132,9 +146,54 @@ def find_error_index(trusted_root, broken_root):
         if not cur_trust.left:
             return path
 
-i = find_error_index(root, root_again)
+if __name__ == "__main__":
+    i = find_error_index(root, root_again)
 
-print(f"It looks like '{important_data[i]}' is the corrupted message!")
+    print(f"It looks like '{corrupted_data[i]}' is the corrupted message!")
 
-# Try changing the list at line 85 to swap where the corrupted message is, it
+# Try changing corrupted_data above to swap where the corrupted message is, it
 # should find it in log time!
+
+# Going the other way: a client that only wants one message doesn't need the
+# whole tree to check it. The server sends the message plus the hash of the
+# sibling at every level on the way up (a "proof"), and the client can
+# rebuild the path to the root and compare it with the root hash it already
+# trusts. That's log(n) hashes instead of n.
+# The index bits pick left (0) or right (1) at each level from the top, the
+# same trick find_error_index uses.
+
+def merkle_proof(root, index):
+    if instrument.enabled:
+        instrument.count("merkle.proofs")
+    depth = 0
+    cur = root
+    while cur.left:
+        cur = cur.left
+        depth += 1
+
+    proof = []
+    cur = root
+    for level in reversed(range(depth)):
+        if index >> level & 1:
+            proof.append((cur.left.hash, "left"))
+            cur = cur.right
+        else:
+            proof.append((cur.right.hash, "right"))
+            cur = cur.left
+
+# We walked top down, but checking goes bottom up
+    return proof[::-1]
+
+def verify_proof(root_hash, data, proof):
+    cur = md5(data)
+    for sibling, side in proof:
+        if side == "left":
+            cur = md5(sibling + cur)
+        else:
+            cur = md5(cur + sibling)
+    return cur == root_hash
+
+if __name__ == "__main__":
+    proof = merkle_proof(root, 4)
+    print(f"'{important_data[4]}' checks out: {verify_proof(root.hash, important_data[4], proof)}")
+    print(f"'{corrupted_data[4]}' checks out: {verify_proof(root.hash, corrupted_data[4], proof)}")
@@ -0,0 +1,77 @@
+# Every membership check in accumulator.py costs a blinding, a trip to the
+# server, an unblinding and a Bloom lookup. Clients tend to ask about the same
+# people over and over though (the same regulars buying chocolate every day),
+# and the answer can't change until the filter does. So the client can just
+# remember what it found out.
+#
+# Each answer is remembered along with the filter version it came from. As
+# soon as the client sees a different version, everything it remembered gets
+# thrown out. On top of that, answers expire after a while (ttl seconds), and
+# only the most recently used max_entries answers are kept.
+
+import time
+from collections import OrderedDict
+
+class QueryCache:
+    def __init__(self, max_entries=1024, ttl=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def invalidate(self, version=None):
+        if self.entries:
+            self.invalidations += 1
+        self.entries.clear()
+        self.version = version
+
+# The OrderedDict keeps everything in order of last use: a hit moves the entry
+# to the end, so the one at the front is always the least recently used.
+
+    def get(self, version, element):
+        if version != self.version:
+            self.invalidate(version)
+
+        entry = self.entries.get(element)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        signature, is_member, expires = entry
+        if self.clock() >= expires:
+            del self.entries[element]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(element)
+        self.hits += 1
+        return signature, is_member
+
+    def put(self, version, element, signature, is_member):
+        if version != self.version:
+            self.invalidate(version)
+        self.entries[element] = (signature, is_member, self.clock() + self.ttl)
+        self.entries.move_to_end(element)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
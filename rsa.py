@@ -5,6 +5,9 @@
 
 import sys
 
+import instrument
+from md5 import md5, md5_stream
+
 # First let's talk about the keys themselves. In RSA world, the three monster
 # numbers below are the keys. Specifically, the public key is the (E, N) pair,
 # and the private key is the (D, N) pair.
@@ -22,6 +25,19 @@ N = 0xDA3834CEB558DA1EBF9CF3FA1AAC132E35EA0A1BCBCDF435E4E7E9A89A994D8E173FC84FAA
 E = 0x010001
 D = 0x0AB99A76D258E4978049618058513EBC15B04400EBBA5A974F81CA6D1BF40EE8BDE1C7A18ABD6C92F543C76A937D865707219D7958C95813EC6209BC3899377F897D451853EE1B69A1DD03D1BEFDCF64D7BE9A3EF0B1D8223F6606784EEBA5C43BC1D836D74655A478239E50FD20B6323AE429CDF0468CBFA2F5A0B3D5982FB1
 
+# And those two big primes are P and Q (N = P * Q). Only the owner of the
+# private key knows them, and knowing them makes raising to D faster (see
+# keyring.py).
+P = 0xF5B2E183392A27F85CBF274A24D2F07301B9619220AF0F6876D5128E2830F98086C5D7182F23615235DC885E8FB8E643D04677FC9DDC7B0764E4E44C707F684D
+Q = 0xE35E6325E49C1B5FFBB6A162E2A43A76138E2A54B5CD7F8B788C5D485D4C4277B87D0FAD15B24A0AE8EBF245F7E0BC592A50AE12886A3D77EE2F50B216D91D55
+
+# Anything that remembers signatures (like a cache) needs a short way to say
+# which key they were made with. Hashing the public half of the key works,
+# since it's unique to the key and safe to share.
+
+def key_fingerprint(n=N, e=E):
+    return md5(f"{n:x}:{e:x}")[:16]
+
 # Math works best on numbers, so we need some way of representing whatever
 # data we have as integers. It doesn't really matter what encoding we use
 # here as long as it's consistent between the two.
@@ -41,17 +57,76 @@ def verify(msg):
 
 def sign(msg):
     msg = encode_string_as_int(msg)
+    if msg >= N:
+        raise ValueError("message is too long to sign directly, use hash_sign")
     s = raise_to_d(msg)
     return f"{s:x}"
 
+# These two are where all of the expensive math happens, so they're what we
+# time when instrumentation is on
+
 def raise_to_d(i):
-    return pow(i, D, N)
+    if not instrument.enabled:
+        return pow(i, D, N)
+    with instrument.timed("rsa.raise_to_d"):
+        return pow(i, D, N)
 
 def raise_to_e(i):
-    return pow(i, E, N)
+    if not instrument.enabled:
+        return pow(i, E, N)
+    with instrument.timed("rsa.raise_to_e"):
+        return pow(i, E, N)
 
 # That's pretty much all of it. Most of the complexity is generating the keys
 # (and figuring this out in the first place).
+
+# There's one big catch with sign() though. The whole message turns into one
+# number, and the math only works for numbers smaller than N. N is 1024 bits,
+# so anything past 128 bytes wraps around mod N and we'd be signing some other
+# message entirely (that's why sign() refuses). Long messages also make for
+# huge numbers that are slow to work with.
+# The fix is the one from the tour: hash the message, and only sign the hash.
+# The hash is always the same size, so signing a name and signing a
+# multi-megabyte file costs the same one exponentiation.
+
+# We don't sign the bare 16 byte digest. It gets padded out to the size of N
+# the same way PKCS #1 v1.5 does it: 00 01 FF FF ... FF 00, then a fixed
+# header that says "this is an MD5 digest", then the digest itself.
+
+MD5_DIGEST_INFO = bytes.fromhex("3020300c06082a864886f70d020505000410")
+
+def encode_digest(digest, n=N):
+    k = (n.bit_length() + 7) // 8
+    t = MD5_DIGEST_INFO + bytes.fromhex(digest)
+    padding = b"\xff" * (k - len(t) - 3)
+    return int.from_bytes(b"\x00\x01" + padding + b"\x00" + t, byteorder="big")
+
+# Strings and bytes get hashed in one go, anything we can read() from (open
+# files, sockets, BytesIO) gets hashed a piece at a time
+
+def digest_of(msg):
+    if hasattr(msg, "read"):
+        return md5_stream(msg)
+    return md5(msg)
+
+def hash_sign(msg):
+    s = raise_to_d(encode_digest(digest_of(msg)))
+    return f"{s:x}"
+
+# There's nothing to recover here (the hash doesn't tell us the message), so
+# verifying means redoing the padded hash and checking that it matches
+
+def hash_verify(msg, sig):
+    return raise_to_e(int(sig, 16)) == encode_digest(digest_of(msg))
+
+def hash_sign_file(path):
+    with open(path, "rb") as f:
+        return hash_sign(f)
+
+def hash_verify_file(path, sig):
+    with open(path, "rb") as f:
+        return hash_verify(f, sig)
+
 # Here's a simple way to lock/unlock via the CLI
 if __name__ == "__main__":
     msg = sys.argv[2]
@@ -59,3 +134,7 @@ if __name__ == "__main__":
         print(sign(msg))
     if sys.argv[1] == "verify":
         print(verify(msg))
+    if sys.argv[1] == "hash-sign":
+        print(hash_sign_file(msg))
+    if sys.argv[1] == "hash-verify":
+        print(hash_verify_file(msg, sys.argv[3]))
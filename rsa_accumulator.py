@@ -0,0 +1,212 @@
+# Despite the name, accumulator.py is really a Bloom filter full of RSA
+# signatures, which is why a client has to ask the server every time it wants
+# to check something. Here's the "real" RSA accumulator, built on the same N
+# from rsa.py. Nobody needs to be online to check membership: whoever adds an
+# element hands out a small proof (a "witness") along with it, and anyone can
+# check that proof against the accumulator by themselves.
+#
+# The idea goes like this:
+# 1. Turn every element into a prime number p.
+# 2. The accumulator is A = g^(p1 * p2 * ... * pn) mod N for some fixed g.
+# 3. The witness for element i is the same thing with p_i left out of the
+# product: w_i = g^(product of every other p) mod N.
+# 4. To check, raise the witness to p_i. If the element really is in there,
+# w_i^p_i is exactly A again.
+# Faking a witness for something that isn't in there would mean taking a p-th
+# root mod N without knowing the factors of N, which is the same hard problem
+# that keeps RSA safe.
+
+import math
+from functools import lru_cache
+
+# Please don't use random for cryptographic purposes.
+from random import getrandbits
+
+from md5 import md5
+from rsa import N
+
+# g can be pretty much anything, as long as everyone agrees on it
+
+G = 3
+
+# Step 1: turning elements into primes.
+# We hash the element, and if the hash (as a number) isn't prime, we try
+# again with a counter stuck on the front until we find one that is. Primes
+# near 2^128 are about 1 in 45 odd numbers, so that doesn't take long.
+# Checking for primes for real is slow, so we use Miller-Rabin: it can only
+# be fooled by a handful of very rare numbers, and checking against lots of
+# bases makes that practically impossible. The bases are fixed so everyone
+# gets the same prime for the same element.
+# Before bothering with any of that we throw out anything divisible by a
+# small prime, which is most numbers, with one gcd.
+
+SMALL_PRIMES = [p for p in range(2, 1000) if all(p % d for d in range(2, int(p ** 0.5) + 1))]
+SMALL_PRIMES_PRODUCT = math.prod(SMALL_PRIMES)
+
+def is_probable_prime(n):
+    if n < 1000:
+        return n in SMALL_PRIMES
+    if math.gcd(n, SMALL_PRIMES_PRODUCT) != 1:
+        return False
+
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+
+    for a in SMALL_PRIMES[:20]:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+# The same element always turns into the same prime, so there's no reason to
+# do the search more than once
+
+@lru_cache(maxsize=65536)
+def hash_to_prime(element):
+    counter = 0
+    while True:
+        candidate = int(md5(f"{counter}:{element}"), 16) | (1 << 127) | 1
+        if is_probable_prime(candidate):
+            return candidate
+        counter += 1
+
+# Multiplying a long list of big numbers one at a time means every step
+# multiplies by an ever bigger running total. Multiplying in pairs, then
+# pairs of pairs, etc. keeps both sides about the same size, which is faster.
+
+def product(values):
+    values = list(values)
+    if not values:
+        return 1
+    while len(values) > 1:
+        pairs = [values[i] * values[i + 1] for i in range(0, len(values) - 1, 2)]
+        if len(values) % 2:
+            pairs.append(values[-1])
+        values = pairs
+    return values[0]
+
+# Step 2: the accumulator itself
+
+def accumulate(elements, n=N, g=G):
+    return pow(g, product(hash_to_prime(x) for x in elements), n)
+
+# Step 3: witnesses. Making one is just leaving the element's prime out.
+
+# (An element that isn't in the list has no prime to leave out, and so no
+# witness.)
+
+def witness(elements, element, n=N, g=G):
+    p = hash_to_prime(element)
+    exponent, remainder = divmod(product(hash_to_prime(x) for x in elements), p)
+    if remainder:
+        raise ValueError(f"{element} isn't in the accumulator, so it has no witness")
+    return pow(g, exponent, n)
+
+# But doing that for every element is n exponentiations, each with an
+# exponent about n primes long: n^2 work. We can share most of it instead.
+# Split the primes into a left half and a right half. Every witness for
+# something on the left includes all of the right primes, so raise g to the
+# right half's product once, and hand that to the left half as its new g.
+# Same thing the other way around, and keep splitting until each half is a
+# single prime. Whatever g that prime ends up with is its witness.
+# Every level of splitting does about n primes worth of exponentiation, and
+# there are log n levels, so it's n log n work instead of n^2.
+
+def root_factor(g, primes, n):
+    if len(primes) == 1:
+        return [g]
+    half = len(primes) // 2
+    left = primes[:half]
+    right = primes[half:]
+    g_left = pow(g, product(right), n)
+    g_right = pow(g, product(left), n)
+    return root_factor(g_left, left, n) + root_factor(g_right, right, n)
+
+def all_witnesses(elements, n=N, g=G):
+    primes = [hash_to_prime(x) for x in elements]
+    if not primes:
+        return []
+    return root_factor(g, primes, n)
+
+# Step 4: checking a witness, no server needed
+# One wrinkle: -1 is a number everybody knows with (-1)^2 = 1 mod N, so
+# flipping the sign of a witness is invisible to the batch check below. To
+# keep the two checks agreeing, both of them treat A and -A (that's N - A) as
+# the same thing. That doesn't help a cheater, since a w with w^p = -A means
+# -w is a real witness with (-w)^p = A (p is odd).
+
+def verify_witness(acc, element, witness, n=N):
+    return pow(witness, hash_to_prime(element), n) in (acc % n, -acc % n)
+
+# Checking lots of witnesses at once can be done with one comparison. If every
+# w_i^p_i is A, then multiplying them together with some random powers c_i
+# gives w_1^(p_1 c_1) * w_2^(p_2 c_2) * ... = A^(c_1 + c_2 + ...). If even
+# one witness is wrong, the random c_i make it really unlikely (about 1 in
+# 2^64, for anyone who can't factor N) that things cancel out and it still
+# matches. The exception is sign flips: negating any witnesses only changes
+# the left side by a factor of -1 or 1, which the random c_i can't catch half
+# the time. So we square both sides, which makes the check ignore signs the
+# same way verify_witness does, and then it really does catch everything else.
+# Rather than doing each w_i^(p_i c_i) separately, we walk down the bits of
+# all of the exponents at the same time. Every step squares the running
+# total once, then multiplies in each witness whose exponent has that bit
+# set. That shares all of the squaring between every witness.
+
+def multi_pow(bases, exponents, n):
+    result = 1
+    for bit in reversed(range(max(e.bit_length() for e in exponents))):
+        result = result * result % n
+        for base, e in zip(bases, exponents):
+            if e >> bit & 1:
+                result = result * base % n
+    return result
+
+def batch_verify(acc, elements, witnesses, n=N):
+    elements = list(elements)
+    witnesses = list(witnesses)
+    if len(elements) != len(witnesses):
+        raise ValueError(f"{len(elements)} elements but {len(witnesses)} witnesses")
+    if not elements:
+        return True
+    coefficients = [getrandbits(64) for _ in elements]
+    exponents = [hash_to_prime(x) * c for x, c in zip(elements, coefficients)]
+    combined = multi_pow(witnesses, exponents, n)
+    return combined * combined % n == pow(acc, 2 * sum(coefficients), n)
+
+# Let's try it out on the same names as accumulator.py
+if __name__ == "__main__":
+    import time
+    from random import sample
+    from accumulator import all_people
+
+    members = sample(all_people, k=50)
+    non_members = [x for x in all_people if x not in members]
+
+    acc = accumulate(members)
+
+    start = time.perf_counter()
+    witnesses = [witness(members, x) for x in members]
+    one_at_a_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    assert all_witnesses(members) == witnesses
+    all_at_once = time.perf_counter() - start
+
+    print(f"{len(members)} witnesses one at a time: {one_at_a_time * 1000:.1f}ms")
+    print(f"{len(members)} witnesses all at once:   {all_at_once * 1000:.1f}ms")
+
+    print(f"{members[0]} is a member: {verify_witness(acc, members[0], witnesses[0])}")
+# There's no witness for a non-member, so the best they can do is borrow one
+    print(f"{non_members[0]} is a member: {verify_witness(acc, non_members[0], witnesses[0])}")
+
+    print(f"All witnesses check out: {batch_verify(acc, members, witnesses)}")
+    print(f"With one bad witness: {batch_verify(acc, members, witnesses[1:] + witnesses[:1])}")